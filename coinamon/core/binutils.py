@@ -228,6 +228,17 @@ class BinReader:
         self.offset += count
         return value
 
+    def read_view(self, count: int = 1) -> memoryview:
+        """
+        Read *count* bytes from buffer without copying them.
+
+        :param count: The number of bytes to read.
+        :return: Requested bytes as a view of the buffer.
+        """
+        value = memoryview(self.buffer)[self.offset:self.offset + count]
+        self.offset += count
+        return value
+
     def read_bytes_reversed(self, count: int = 1) -> bytes:
         """
         Read *count* bytes from buffer.
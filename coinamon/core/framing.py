@@ -0,0 +1,150 @@
+"""
+This module provides asyncio based framing of Bitcoin P2P messages.
+
+Every message on the wire starts with a 24 bytes long header (network magic, command, payload length
+and checksum) followed by the payload. :py:class:`MessageReader` reads messages from
+:py:class:`asyncio.StreamReader`, verifies their checksum and returns the payload wrapped in
+:py:class:`coinamon.core.binutils.BinReader`.
+"""
+
+import asyncio
+import struct
+from typing import Tuple
+
+from . import hashutils
+from .binutils import BinReader
+
+
+MAGIC_MAINNET = bytes.fromhex("f9beb4d9")
+MAGIC_TESTNET = bytes.fromhex("0b110907")
+MAGIC_REGTEST = bytes.fromhex("fabfb5da")
+
+HEADER_SIZE = 24
+COMMAND_SIZE = 12
+CHECKSUM_SIZE = 4
+MAX_MESSAGE_SIZE = 4 * 1000 * 1000
+OFFLOAD_SIZE = 64 * 1024
+
+_HEADER_STRUCT = struct.Struct("<4s12sI4s")
+
+
+def checksum(payload: bytes) -> bytes:
+    """
+    Calculate the checksum of a message payload.
+
+    :param payload: The message payload.
+    :return: The first four bytes of :py:func:`coinamon.core.hashutils.hash256` of the payload.
+    """
+    return hashutils.hash256(payload)[0:CHECKSUM_SIZE]
+
+
+def encode_message(command: str, payload: bytes = b"", magic: bytes = MAGIC_MAINNET) -> bytes:
+    """
+    Encode a message including its header.
+
+    :param command: The message command, e.g. ``"version"``.
+    :param payload: The message payload.
+    :param magic: The network magic bytes.
+    :return: The message ready to be sent over the wire.
+    :raise: :py:exc:`ValueError` if the command is too long.
+    """
+    raw_command = command.encode("ascii")
+    if len(raw_command) > COMMAND_SIZE:
+        raise ValueError("Command '{}' is longer than {} bytes.".format(command, COMMAND_SIZE))
+    return _HEADER_STRUCT.pack(magic, raw_command, len(payload), checksum(payload)) + payload
+
+
+def decode_header(header: bytes, magic: bytes = MAGIC_MAINNET) -> Tuple[str, int, bytes]:
+    """
+    Decode a message header.
+
+    :param header: The 24 bytes long message header.
+    :param magic: The expected network magic bytes.
+    :return: A tuple of the command, the payload length and the payload checksum.
+    :raise: :py:exc:`ValueError` if the header is invalid.
+    """
+    if len(header) != HEADER_SIZE:
+        raise ValueError("Message header must be {} bytes long.".format(HEADER_SIZE))
+    header_magic, raw_command, length, header_checksum = _HEADER_STRUCT.unpack(header)
+    if header_magic != magic:
+        raise ValueError("Unexpected network magic {}.".format(header_magic.hex()))
+
+    # The command is NUL padded and there must be nothing but NULs after the first one.
+    raw_command, _, padding = raw_command.partition(b"\x00")
+    if padding.strip(b"\x00"):
+        raise ValueError("Command is not NUL padded.")
+    try:
+        command = raw_command.decode("ascii")
+    except UnicodeDecodeError:
+        raise ValueError("Command is not ASCII.") from None
+
+    return command, length, header_checksum
+
+
+class MessageReader:
+    """
+    Read Bitcoin P2P messages from :py:class:`asyncio.StreamReader`.
+
+    Messages are read only when requested, so a slow consumer makes the stream reader's buffer fill up,
+    which in turn pauses reading from the transport. Checksums of payloads of at least *offload_size* bytes
+    are calculated in the default executor to keep the event loop responsive.
+
+    The reader is an asynchronous iterator yielding ``(command, BinReader)`` pairs until the peer
+    closes the connection::
+
+        async for command, payload in MessageReader(stream_reader):
+            ...
+    """
+    def __init__(self, reader: asyncio.StreamReader, magic: bytes = MAGIC_MAINNET,
+                 max_size: int = MAX_MESSAGE_SIZE, offload_size: int = OFFLOAD_SIZE):
+        """
+        :param reader: The stream to read messages from.
+        :param magic: The expected network magic bytes.
+        :param max_size: The maximal accepted payload size.
+        :param offload_size: Checksums of payloads of at least this size are calculated in a thread.
+        """
+        self.reader = reader
+        self.magic = magic
+        self.max_size = max_size
+        self.offload_size = offload_size
+
+    async def read_message(self) -> Tuple[str, BinReader]:
+        """
+        Read a single message.
+
+        :return: A tuple of the command and the payload reader.
+        :raise: :py:exc:`ValueError` if the message is invalid or too large,
+            :py:exc:`asyncio.IncompleteReadError` if the stream ends before a whole message is read.
+        """
+        header = await self.reader.readexactly(HEADER_SIZE)
+        return await self._read_payload(header)
+
+    async def _read_payload(self, header: bytes) -> Tuple[str, BinReader]:
+        command, length, expected_checksum = decode_header(header, self.magic)
+        if length > self.max_size:
+            raise ValueError("Message '{}' of {} bytes exceeds the limit of {} bytes.".format(
+                command, length, self.max_size))
+
+        payload = await self.reader.readexactly(length)
+        if length >= self.offload_size:
+            loop = asyncio.get_running_loop()
+            payload_checksum = await loop.run_in_executor(None, checksum, payload)
+        else:
+            payload_checksum = checksum(payload)
+        if payload_checksum != expected_checksum:
+            raise ValueError("Checksum error in message '{}'.".format(command))
+
+        return command, BinReader(payload)
+
+    def __aiter__(self) -> "MessageReader":
+        return self
+
+    async def __anext__(self) -> Tuple[str, BinReader]:
+        try:
+            header = await self.reader.readexactly(HEADER_SIZE)
+        except asyncio.IncompleteReadError as e:
+            # A connection closed between two messages ends the iteration cleanly.
+            if e.partial:
+                raise
+            raise StopAsyncIteration from None
+        return await self._read_payload(header)
@@ -0,0 +1,140 @@
+"""
+This module classifies transaction output scripts (scriptPubKey) and extracts the hashes and witness
+programs embedded in them.
+
+Scripts are matched against length and opcode templates without copying, so the functions work equally
+well with :py:func:`bytes` and with :py:class:`memoryview` slices of a larger buffer (e.g. a whole block).
+Extracted hashes are returned as :py:class:`memoryview` slices of the script.
+"""
+
+import array
+from typing import Iterable, Optional, Tuple, Union
+
+
+SCRIPT_NONSTANDARD = 0
+SCRIPT_P2PK = 1
+SCRIPT_P2PKH = 2
+SCRIPT_P2SH = 3
+SCRIPT_P2WPKH = 4
+SCRIPT_P2WSH = 5
+SCRIPT_P2TR = 6
+SCRIPT_MULTISIG = 7
+SCRIPT_NULL_DATA = 8
+
+OP_0 = 0x00
+OP_1 = 0x51
+OP_16 = 0x60
+OP_RETURN = 0x6a
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_HASH160 = 0xa9
+OP_CHECKSIG = 0xac
+OP_CHECKMULTISIG = 0xae
+
+Script = Union[bytes, bytearray, memoryview]
+
+# Templates indexed by script length. Each template is a tuple of the script type,
+# the (offset, byte) pairs the script must match and the slice of the embedded hash.
+_TEMPLATES = {
+    22: ((SCRIPT_P2WPKH, ((0, OP_0), (1, 0x14)), 2, 22),),
+    23: ((SCRIPT_P2SH, ((0, OP_HASH160), (1, 0x14), (22, OP_EQUAL)), 2, 22),),
+    25: ((SCRIPT_P2PKH, ((0, OP_DUP), (1, OP_HASH160), (2, 0x14), (23, OP_EQUALVERIFY), (24, OP_CHECKSIG)), 3, 23),),
+    34: ((SCRIPT_P2WSH, ((0, OP_0), (1, 0x20)), 2, 34),
+         (SCRIPT_P2TR, ((0, OP_1), (1, 0x20)), 2, 34)),
+    35: ((SCRIPT_P2PK, ((0, 0x21), (34, OP_CHECKSIG)), 1, 34),),
+    67: ((SCRIPT_P2PK, ((0, 0x41), (66, OP_CHECKSIG)), 1, 66),),
+}
+
+_NO_MATCH = (SCRIPT_NONSTANDARD, 0, 0)
+
+
+def _is_multisig(script: Script) -> bool:
+    """
+    Check whether the script is a bare multisig ``OP_m <pubkey>... OP_n OP_CHECKMULTISIG``.
+    """
+    size = len(script)
+    if size < 37 or script[-1] != OP_CHECKMULTISIG:
+        return False
+    m = script[0] - OP_1 + 1
+    n = script[-2] - OP_1 + 1
+    if not 1 <= m <= n <= 16:
+        return False
+
+    offset = 1
+    end = size - 2
+    keys = 0
+    while offset < end:
+        push = script[offset]
+        if push != 0x21 and push != 0x41:
+            return False
+        offset += push + 1
+        keys += 1
+    return offset == end and keys == n
+
+
+def _match(script: Script) -> Tuple[int, int, int]:
+    """
+    Match the script against known templates.
+
+    :return: A tuple of the script type and the start and end offset of the embedded hash.
+    """
+    for script_type, opcodes, start, end in _TEMPLATES.get(len(script), ()):
+        for offset, opcode in opcodes:
+            if script[offset] != opcode:
+                break
+        else:
+            return script_type, start, end
+
+    if script and script[0] == OP_RETURN:
+        return SCRIPT_NULL_DATA, 0, 0
+    if _is_multisig(script):
+        return SCRIPT_MULTISIG, 0, 0
+    return _NO_MATCH
+
+
+def classify(script: Script) -> int:
+    """
+    Classify an output script.
+
+    :param script: The output script.
+    :return: One of ``SCRIPT_*`` constants.
+    """
+    return _match(script)[0]
+
+
+def extract_hash(script: Script) -> Optional[memoryview]:
+    """
+    Extract the hash embedded in an output script without copying it.
+
+    This is the hash160 of P2PKH, P2SH and P2WPKH scripts, the witness program of P2WSH and P2TR scripts
+    and the public key of P2PK scripts.
+
+    :param script: The output script.
+    :return: A view of the embedded hash or ``None`` if the script does not embed a single hash.
+    """
+    return classify_and_extract(script)[1]
+
+
+def classify_and_extract(script: Script) -> Tuple[int, Optional[memoryview]]:
+    """
+    Classify an output script and extract the embedded hash in a single pass.
+    See :py:func:`classify` and :py:func:`extract_hash`.
+
+    :param script: The output script.
+    :return: A tuple of one of ``SCRIPT_*`` constants and a view of the embedded hash or ``None``.
+    """
+    script_type, start, end = _match(script)
+    if start == end:
+        return script_type, None
+    return script_type, memoryview(script)[start:end]
+
+
+def classify_many(scripts: Iterable[Script]) -> array.array:
+    """
+    Classify many output scripts, e.g. all outputs of a block.
+
+    :param scripts: The output scripts.
+    :return: An array of ``SCRIPT_*`` constants (type code ``B``), one per script.
+    """
+    return array.array("B", map(classify, scripts))
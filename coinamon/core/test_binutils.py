@@ -187,3 +187,14 @@ def test_bin_reader():
 
     assert reader.read_uint32() == 0, "lock time"
     assert not reader, "reader empty"
+
+
+def test_bin_reader_read_view():
+    buffer = binascii.unhexlify(RAW_TX)
+    reader = binutils.BinReader(buffer, len(buffer) - 30)
+    assert reader.read_compact_uint() == 25, "size pk_script"
+    view = reader.read_view(25)
+    assert isinstance(view, memoryview) and view.obj is buffer
+    assert view.hex() == "76a914e8a7c9b03caabeafa5a99d98663c7bd7d587ad9e88ac", "pk_script"
+    assert reader.read_uint32() == 0, "lock time"
+    assert not reader, "reader empty"
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from . import framing
+
+
+# The "verack" message of the Bitcoin main network.
+VERACK = bytes.fromhex("f9beb4d976657261636b000000000000000000005df6e0e2")
+
+
+def test_encode_message():
+    assert framing.encode_message("verack") == VERACK
+
+
+def test_decode_header():
+    assert framing.decode_header(VERACK) == ("verack", 0, bytes.fromhex("5df6e0e2"))
+
+
+def test_decode_header_invalid():
+    with pytest.raises(ValueError):
+        framing.decode_header(VERACK, framing.MAGIC_TESTNET)
+    with pytest.raises(ValueError):
+        framing.decode_header(VERACK[:-1])
+    with pytest.raises(ValueError):
+        framing.decode_header(VERACK[:10] + b"\x00x" + VERACK[12:])
+
+
+def read_all(data: bytes, **kwargs) -> list:
+    """
+    Serve *data* from a local fake peer and read all messages from it.
+    """
+    async def serve(reader, writer):
+        writer.write(data)
+        await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            return [(command, payload.read_bytes(len(payload)))
+                    async for command, payload in framing.MessageReader(reader, **kwargs)]
+        finally:
+            writer.close()
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(run())
+
+
+def test_message_reader():
+    large_payload = bytes(range(256)) * 1024
+    data = (
+        VERACK
+        + framing.encode_message("ping", bytes.fromhex("0102030405060708"))
+        + framing.encode_message("block", large_payload)
+    )
+    assert read_all(data, offload_size=1024) == [
+        ("verack", b""),
+        ("ping", bytes.fromhex("0102030405060708")),
+        ("block", large_payload),
+    ]
+
+
+def test_message_reader_checksum_error():
+    message = bytearray(framing.encode_message("ping", bytes.fromhex("0102030405060708")))
+    message[-1] ^= 0xff
+    with pytest.raises(ValueError):
+        read_all(bytes(message))
+
+
+def test_message_reader_max_size():
+    with pytest.raises(ValueError):
+        read_all(framing.encode_message("block", bytes(1025)), max_size=1024)
+
+
+def test_message_reader_truncated():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_all(framing.encode_message("ping", bytes(8))[:-1])
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_all(VERACK[:-1])
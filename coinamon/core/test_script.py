@@ -0,0 +1,75 @@
+import array
+
+from . import script
+
+
+SCRIPTS = (
+    ("76a914e8a7c9b03caabeafa5a99d98663c7bd7d587ad9e88ac",
+     script.SCRIPT_P2PKH, "e8a7c9b03caabeafa5a99d98663c7bd7d587ad9e"),
+    ("a914748284390f9e263a4b766a75d0633c50426eb87587",
+     script.SCRIPT_P2SH, "748284390f9e263a4b766a75d0633c50426eb875"),
+    ("0014751e76e8199196d454941c45d1b3a323f1433bd6",
+     script.SCRIPT_P2WPKH, "751e76e8199196d454941c45d1b3a323f1433bd6"),
+    ("00201863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262",
+     script.SCRIPT_P2WSH, "1863143c14c5166804bd19203356da136c985678cd4d27a1b8c6329604903262"),
+    ("5120a60869f0dbcf1dc659c9cecbaf8050135ea9e8cdc487053f1dc6880949dc684c",
+     script.SCRIPT_P2TR, "a60869f0dbcf1dc659c9cecbaf8050135ea9e8cdc487053f1dc6880949dc684c"),
+    ("210279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798ac",
+     script.SCRIPT_P2PK, "0279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798"),
+    ("6a0b68656c6c6f20776f726c64",
+     script.SCRIPT_NULL_DATA, None),
+    ("51"
+     "210279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798"
+     "2102c6047f9441ed7d6d3045406e95c07cd85c778e4b8cef3ca7abac09b95c709ee5"
+     "52ae",
+     script.SCRIPT_MULTISIG, None),
+    ("", script.SCRIPT_NONSTANDARD, None),
+    ("76a914e8a7c9b03caabeafa5a99d98663c7bd7d587ad9e88ad",
+     script.SCRIPT_NONSTANDARD, None),
+    ("52"
+     "210279be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798"
+     "51ae",
+     script.SCRIPT_NONSTANDARD, None),
+)
+
+
+def test_classify():
+    for data, script_type, _ in SCRIPTS:
+        assert script.classify(bytes.fromhex(data)) == script_type, data
+
+
+def test_extract_hash():
+    for data, _, result in SCRIPTS:
+        value = script.extract_hash(bytes.fromhex(data))
+        if result is None:
+            assert value is None, data
+        else:
+            assert isinstance(value, memoryview)
+            assert value.hex() == result, data
+
+
+def test_memoryview_slices():
+    buffer = b"".join(bytes.fromhex(data) for data, _, _ in SCRIPTS)
+    view = memoryview(buffer)
+    offset = 0
+    for data, script_type, result in SCRIPTS:
+        size = len(data) // 2
+        slice_ = view[offset:offset + size]
+        assert script.classify(slice_) == script_type, data
+        value = script.extract_hash(slice_)
+        if result is not None:
+            assert value.obj is buffer
+            assert value.hex() == result, data
+        offset += size
+
+
+def test_classify_many():
+    types = script.classify_many(bytes.fromhex(data) for data, _, _ in SCRIPTS)
+    assert types == array.array("B", (script_type for _, script_type, _ in SCRIPTS))
+
+
+def test_classify_and_extract():
+    for data, script_type, result in SCRIPTS:
+        value_type, value = script.classify_and_extract(bytes.fromhex(data))
+        assert value_type == script_type, data
+        assert (value and value.hex()) == result, data
@@ -0,0 +1,188 @@
+import os
+
+import pytest
+
+from . import hashutils
+from . import script
+from . import utxo
+from .binutils import BinReader
+
+
+GENESIS_BLOCK = bytes.fromhex(
+    "0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f61"
+    "7fc81bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c01"
+    "01000000010000000000000000000000000000000000000000000000000000000000000000ffffffff4d04ffff001d0104455468"
+    "652054696d65732030332f4a616e2f32303039204368616e63656c6c6f72206f6e206272696e6b206f66207365636f6e642062"
+    "61696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104678afdb0fe5548271967f1a67130b7105cd6a828"
+    "e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d578a4c702b6bf11d5fac00000000"
+)
+GENESIS_TXID = bytes.fromhex("4a5e1e4baab89f3a32518a88c31bc87f618f76673e2cc77ab2127b7afdeda33b")[::-1]
+GENESIS_PUBKEY = bytes.fromhex(
+    "04678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7"
+    "ba0b8d578a4c702b6bf11d5f")
+
+# A segwit transaction spending the genesis output (not valid, only well formed).
+SEGWIT_VERSION = bytes.fromhex("02000000")
+SEGWIT_BODY = (
+    bytes.fromhex("01") + GENESIS_TXID + bytes.fromhex("00000000" "00" "fdffffff")
+    + bytes.fromhex("02" "e803000000000000" "160014751e76e8199196d454941c45d1b3a323f1433bd6"
+                    "0000000000000000" "036a0100")
+)
+SEGWIT_WITNESS = bytes.fromhex("02" "0101" "0102")
+SEGWIT_LOCK_TIME = bytes.fromhex("00000000")
+SEGWIT_TX = SEGWIT_VERSION + b"\x00\x01" + SEGWIT_BODY + SEGWIT_WITNESS + SEGWIT_LOCK_TIME
+SEGWIT_TXID = hashutils.hash256(SEGWIT_VERSION + SEGWIT_BODY + SEGWIT_LOCK_TIME)
+
+
+def make_utxo(i: int) -> utxo.Utxo:
+    return utxo.Utxo(hashutils.hash256(i.to_bytes(4, "little")), i % 3, i * 1000,
+                     script.SCRIPT_P2WPKH, hashutils.hash160(i.to_bytes(4, "little")))
+
+
+def test_read_block_changes():
+    adds, spends = utxo.read_block_changes(BinReader(GENESIS_BLOCK))
+    assert adds == [utxo.Utxo(GENESIS_TXID, 0, 5000000000, script.SCRIPT_P2PK, hashutils.hash160(GENESIS_PUBKEY))]
+    assert spends == []
+
+
+def test_read_transaction_changes_segwit():
+    adds = []
+    spends = []
+    reader = BinReader(SEGWIT_TX)
+    assert utxo.read_transaction_changes(reader, adds, spends) == SEGWIT_TXID
+    assert not reader, "reader empty"
+    assert adds == [utxo.Utxo(SEGWIT_TXID, 0, 1000, script.SCRIPT_P2WPKH,
+                              bytes.fromhex("751e76e8199196d454941c45d1b3a323f1433bd6"))]
+    assert spends == [(GENESIS_TXID, 0)]
+
+
+def test_read_transaction_changes_invalid_flag():
+    with pytest.raises(ValueError):
+        utxo.read_transaction_changes(BinReader(SEGWIT_TX.replace(b"\x00\x01", b"\x00\x02", 1)), [], [])
+
+
+def test_store(tmp_path):
+    path = str(tmp_path / "utxo")
+    utxos = [make_utxo(i) for i in range(1000)]
+    with utxo.UtxoStore(path, capacity=16) as store:
+        store.apply(adds=utxos)
+        assert len(store) == 1000
+        assert store.capacity >= 1000 / utxo.MAX_LOAD
+        for item in utxos:
+            assert store.get(item.txid, item.vout) == item
+
+        store.apply(adds=[make_utxo(1000)], spends=[(item.txid, item.vout) for item in utxos[0:500]])
+        store.spend(GENESIS_TXID, 0)
+        assert len(store) == 501
+        assert (utxos[0].txid, utxos[0].vout) not in store
+        assert store.get(utxos[0].txid, utxos[0].vout) is None
+
+    with utxo.UtxoStore(path) as store:
+        assert len(store) == 501
+        for item in utxos[500:] + [make_utxo(1000)]:
+            assert store.get(item.txid, item.vout) == item
+
+
+def test_store_spend_added_in_batch(tmp_path):
+    with utxo.UtxoStore(str(tmp_path / "utxo")) as store:
+        adds, spends = utxo.read_block_changes(BinReader(GENESIS_BLOCK))
+        store.apply(adds, spends)
+        adds = []
+        spends = []
+        utxo.read_transaction_changes(BinReader(SEGWIT_TX), adds, spends)
+        store.apply(adds, spends)
+        assert (GENESIS_TXID, 0) not in store
+        assert (SEGWIT_TXID, 0) in store
+        assert len(store) == 1
+
+
+def test_store_invalid_hash(tmp_path):
+    with utxo.UtxoStore(str(tmp_path / "utxo")) as store:
+        with pytest.raises(ValueError):
+            store.add(utxo.Utxo(GENESIS_TXID, 0, 1, script.SCRIPT_P2PK, GENESIS_PUBKEY))
+
+
+def test_store_recovery(tmp_path):
+    path = str(tmp_path / "utxo")
+    utxos = [make_utxo(i) for i in range(100)]
+    with utxo.UtxoStore(path) as store:
+        store.apply(adds=utxos[0:50])
+    with open(path, "rb") as file:
+        table = file.read()
+
+    # Simulate a crash: the journal has the batches but the table has not been flushed.
+    store = utxo.UtxoStore(path)
+    store.apply(adds=utxos[50:])
+    store.apply(spends=[(item.txid, item.vout) for item in utxos[0:10]])
+    with open(store.journal_path, "rb") as file:
+        journal = file.read()
+    store.close()
+    with open(path, "wb") as file:
+        file.write(table)
+    with open(store.journal_path, "wb") as file:
+        # The last batch is incomplete and must be ignored.
+        file.write(journal)
+        file.write(journal[0:100])
+
+    with utxo.UtxoStore(path) as store:
+        assert len(store) == 90
+        for item in utxos[10:]:
+            assert store.get(item.txid, item.vout) == item
+        assert os.path.getsize(store.journal_path) == 0
+
+
+def test_store_recovery_torn_table(tmp_path):
+    path = str(tmp_path / "utxo")
+    utxos = [make_utxo(i) for i in range(50)]
+
+    # Outputs whose slot crosses a page boundary, so a partial write back tears them.
+    torn = []
+    i = 50
+    while len(torn) < 10:
+        item = make_utxo(i)
+        offset = 64 + utxo._slot_index(item.txid, item.vout, utxo.DEFAULT_CAPACITY - 1) * 80
+        if offset // 4096 != (offset + 79) // 4096:
+            torn.append(item)
+        i += 1
+
+    with utxo.UtxoStore(path) as store:
+        store.apply(adds=utxos)
+    with open(path, "rb") as file:
+        old_table = file.read()
+
+    store = utxo.UtxoStore(path)
+    store.apply(adds=torn, spends=[(item.txid, item.vout) for item in utxos[0:10]])
+    with open(store.journal_path, "rb") as file:
+        journal = file.read()
+    store.close()
+    with open(path, "rb") as file:
+        new_table = file.read()
+
+    # Simulate a power loss where only every other page of the table was written back.
+    for parity in (0, 1):
+        table = b"".join((new_table if page // 4096 % 2 == parity else old_table)[page:page + 4096]
+                         for page in range(0, len(new_table), 4096))
+        with open(path, "wb") as file:
+            file.write(table)
+        with open(store.journal_path, "wb") as file:
+            file.write(journal)
+
+        with utxo.UtxoStore(path) as store:
+            assert len(store) == 50
+            for item in utxos[10:] + torn:
+                assert store.get(item.txid, item.vout) == item
+            store.apply(spends=[(item.txid, item.vout) for item in utxos[10:] + torn])
+            assert len(store) == 0
+            assert all(flag != 1 for flag in store.map[64::80])
+
+
+def test_store_invalid_txid(tmp_path):
+    with utxo.UtxoStore(str(tmp_path / "utxo")) as store:
+        with pytest.raises(ValueError):
+            store.add(utxo.Utxo(GENESIS_TXID[0:31], 0, 1, script.SCRIPT_P2WPKH, b""))
+        with pytest.raises(ValueError):
+            store.spend(GENESIS_TXID.hex().encode(), 0)
+        with pytest.raises(ValueError):
+            store.get(GENESIS_TXID + b"\x00", 0)
+        with pytest.raises(ValueError):
+            (GENESIS_TXID[0:31], 0) in store
@@ -0,0 +1,484 @@
+"""
+This module provides a compact persistent store of unspent transaction outputs (UTXO).
+
+Every output is packed into a fixed-width record (outpoint, amount, script type and the embedded hash)
+stored in a memory-mapped open addressing hash table keyed by the outpoint. Changes are applied in batches,
+typically one per block (see :py:func:`read_block_changes`). The images of all slots a batch modifies are
+appended to a journal and synced before the table is modified. When the store is opened again, the slot images
+of batches recorded since the last checkpoint are written over the table, which repairs slots that were written
+back only partially, e.g. when a power loss interrupted the write back of a page.
+"""
+
+import collections
+import mmap
+import os
+import struct
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from . import hashutils
+from . import script
+from .binutils import BinReader
+
+
+HASH_SIZE = 32
+DEFAULT_CAPACITY = 1024
+MAX_LOAD = 0.75
+JOURNAL_LIMIT = 64 * 1024 * 1024
+
+_MAGIC = b"UTXO"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIQQQ")
+_HEADER_SIZE = 64
+
+# flag, outpoint (txid + vout), amount, script type, hash size, hash, padding
+_SLOT = struct.Struct("<B36sQBB32sx")
+_SLOT_SIZE = _SLOT.size
+_OUTPOINT = struct.Struct("<32sI")
+
+_EMPTY = 0
+_USED = 1
+_DELETED = 2
+
+# payload size, payload checksum; the payload is the counters followed by (offset, slot image) entries
+_BATCH = struct.Struct("<I4s")
+_COUNTERS = struct.Struct("<QQ")
+_OFFSET = struct.Struct("<Q")
+_ENTRY_SIZE = _OFFSET.size + _SLOT_SIZE
+
+_COINBASE_TXID = bytes(32)
+_COINBASE_VOUT = 0xffffffff
+
+Utxo = collections.namedtuple("Utxo", "txid vout amount script_type hash")
+Utxo.__doc__ = "An unspent transaction output. The *txid* is in internal (not displayed) byte order."
+
+Outpoint = Tuple[bytes, int]
+
+_NO_PENDING = {}
+
+
+def _outpoint(txid: bytes, vout: int) -> bytes:
+    if len(txid) != 32:
+        raise ValueError("Transaction id must be 32 bytes long, got {} bytes.".format(len(txid)))
+    return _OUTPOINT.pack(txid, vout)
+
+
+def _slot_index(txid: bytes, vout: int, mask: int) -> int:
+    # Transaction ids are hashes, so their leading bytes are already uniformly distributed.
+    return (int.from_bytes(txid[0:8], "little") + vout * 0x9e3779b97f4a7c15) & mask
+
+
+class UtxoStore:
+    """
+    Memory-mapped store of unspent transaction outputs.
+
+    The table is stored in the file *path*, the journal in *path* ``+ ".journal"``. The table grows
+    automatically, doubling its capacity whenever it is more than :py:data:`MAX_LOAD` full.
+    """
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY, sync: bool = True,
+                 journal_limit: int = JOURNAL_LIMIT):
+        """
+        :param path: The path of the table file. It is created if it does not exist.
+        :param capacity: The initial number of slots of a new table, rounded up to a power of two.
+        :param sync: Whether to sync the journal after every batch.
+        :param journal_limit: The journal size that triggers a :py:meth:`checkpoint`.
+        :raise: :py:exc:`ValueError` if the table file is invalid.
+
+        :var path: The path of the table file.
+        :vartype path: str
+        :var journal_path: The path of the journal file.
+        :vartype journal_path: str
+        """
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.sync = sync
+        self.journal_limit = journal_limit
+
+        if not os.path.exists(path):
+            self._create_table(path, 1 << max(capacity - 1, 1).bit_length())
+        self._open_table()
+
+        self.journal = open(self.journal_path, "a+b")
+        self._recover()
+
+    @staticmethod
+    def _create_table(path: str, capacity: int) -> None:
+        with open(path, "wb") as file:
+            file.write(_HEADER.pack(_MAGIC, _VERSION, capacity, 0, 0))
+            file.truncate(_HEADER_SIZE + capacity * _SLOT_SIZE)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _open_table(self) -> None:
+        self.file = open(self.path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        magic, version, self.capacity, self.count, self.deleted = _HEADER.unpack_from(self.map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("File '{}' is not a UTXO table.".format(self.path))
+        if len(self.map) != _HEADER_SIZE + self.capacity * _SLOT_SIZE:
+            raise ValueError("File '{}' is truncated.".format(self.path))
+        self.mask = self.capacity - 1
+
+    def _close_table(self) -> None:
+        self.map.close()
+        self.file.close()
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(self.map, 0, _MAGIC, _VERSION, self.capacity, self.count, self.deleted)
+
+    def _recover(self) -> None:
+        """
+        Write the slot images of complete batches from the journal over the table and discard
+        an incomplete batch.
+        """
+        self.journal.seek(0)
+        data = self.journal.read()
+        if not data:
+            return
+
+        map_ = self.map
+        reader = BinReader(memoryview(data))
+        while len(reader) >= _BATCH.size:
+            size, checksum = _BATCH.unpack(reader.read_view(_BATCH.size))
+            if len(reader) < size:
+                break
+            payload = reader.read_view(size)
+            if hashutils.hash256(payload)[0:4] != checksum:
+                break
+            self.count, self.deleted = _COUNTERS.unpack_from(payload, 0)
+            for start in range(_COUNTERS.size, size, _ENTRY_SIZE):
+                offset = _OFFSET.unpack_from(payload, start)[0]
+                if not _HEADER_SIZE <= offset <= len(map_) - _SLOT_SIZE:
+                    raise ValueError("Journal '{}' does not match the table.".format(self.journal_path))
+                start += _OFFSET.size
+                map_[offset:offset + _SLOT_SIZE] = payload[start:start + _SLOT_SIZE]
+        self.checkpoint()
+
+    def _slot(self, offset: int, pending: dict) -> bytes:
+        image = pending.get(offset)
+        if image is None:
+            return self.map[offset:offset + _SLOT_SIZE]
+        return image
+
+    def _find(self, outpoint: bytes, txid: bytes, vout: int, pending: dict = _NO_PENDING) -> Tuple[int, int]:
+        """
+        Find the slot of an outpoint.
+
+        :param pending: Slot images of a batch being prepared, indexed by offset, which take precedence
+            over the table.
+        :return: The offset of the slot holding the outpoint or -1, and the offset of the first free slot
+            where the outpoint can be inserted.
+        """
+        map_ = self.map
+        index = _slot_index(txid, vout, self.mask)
+        free = -1
+        while True:
+            offset = _HEADER_SIZE + index * _SLOT_SIZE
+            image = pending.get(offset) if pending else None
+            if image is None:
+                flag = map_[offset]
+            else:
+                flag = image[0]
+            if flag == _EMPTY:
+                return -1, offset if free < 0 else free
+            if flag == _USED:
+                key = map_[offset + 1:offset + 37] if image is None else image[1:37]
+                if key == outpoint:
+                    return offset, offset
+            elif free < 0:
+                free = offset
+            index = (index + 1) & self.mask
+
+    def _prepare(self, adds: List[bytes], spends: List[Tuple[bytes, bytes, int]]) -> dict:
+        """
+        Resolve a batch to the images of the slots it modifies, without modifying the table.
+
+        :param adds: The slot images of added outputs.
+        :param spends: The outpoints, txids and vouts of spent outputs.
+        :return: The new slot images indexed by offset.
+        """
+        pending = {}
+        for image in adds:
+            txid, vout = _OUTPOINT.unpack_from(image, 1)
+            offset, free = self._find(image[1:37], txid, vout, pending)
+            if offset < 0:
+                if self._slot(free, pending)[0] == _DELETED:
+                    self.deleted -= 1
+                self.count += 1
+                offset = free
+            pending[offset] = image
+        for outpoint, txid, vout in spends:
+            offset, _ = self._find(outpoint, txid, vout, pending)
+            if offset >= 0:
+                pending[offset] = bytes((_DELETED,)) + self._slot(offset, pending)[1:]
+                self.count -= 1
+                self.deleted += 1
+        return pending
+
+    def _reserve(self, additions: int) -> None:
+        """
+        Grow or rebuild the table so that *additions* more outputs keep it under :py:data:`MAX_LOAD`.
+        """
+        if self.count + self.deleted + additions <= self.capacity * MAX_LOAD:
+            return
+
+        capacity = self.capacity
+        while (self.count + additions) * 2 > capacity:
+            capacity *= 2
+
+        # Build the new table next to the old one and replace it atomically. The journal holds slot images
+        # of a single table layout, so it is emptied before and after the replacement.
+        self.checkpoint()
+        new_path = self.path + ".new"
+        self._create_table(new_path, capacity)
+        with open(new_path, "r+b") as file, mmap.mmap(file.fileno(), 0) as new_map:
+            mask = capacity - 1
+            for offset in range(_HEADER_SIZE, len(self.map), _SLOT_SIZE):
+                if self.map[offset] != _USED:
+                    continue
+                txid, vout = _OUTPOINT.unpack_from(self.map, offset + 1)
+                index = _slot_index(txid, vout, mask)
+                while new_map[_HEADER_SIZE + index * _SLOT_SIZE] != _EMPTY:
+                    index = (index + 1) & mask
+                new_offset = _HEADER_SIZE + index * _SLOT_SIZE
+                new_map[new_offset:new_offset + _SLOT_SIZE] = self.map[offset:offset + _SLOT_SIZE]
+            _HEADER.pack_into(new_map, 0, _MAGIC, _VERSION, capacity, self.count, 0)
+            new_map.flush()
+
+        self._close_table()
+        os.replace(new_path, self.path)
+        directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self._open_table()
+        self.checkpoint()
+
+    def apply(self, adds: Iterable[Utxo] = (), spends: Iterable[Outpoint] = ()) -> None:
+        """
+        Add and spend outputs in a single batch. Outputs are added before the spends are applied,
+        so a batch may spend outputs it adds.
+
+        :param adds: The outputs to add.
+        :param spends: The outpoints (txid, vout) to spend. Unknown outpoints are ignored.
+        :raise: :py:exc:`ValueError` if a txid is not 32 bytes long or a hash is longer than :py:data:`HASH_SIZE`.
+        """
+        images = []
+        for utxo in adds:
+            if len(utxo.hash) > HASH_SIZE:
+                raise ValueError("Hash of {} bytes is longer than {} bytes.".format(len(utxo.hash), HASH_SIZE))
+            images.append(_SLOT.pack(_USED, _outpoint(utxo.txid, utxo.vout), utxo.amount,
+                                     utxo.script_type, len(utxo.hash), bytes(utxo.hash)))
+        outpoints = [(_outpoint(txid, vout), txid, vout) for txid, vout in spends]
+        if not images and not outpoints:
+            return
+
+        self._reserve(len(images))
+        pending = self._prepare(images, outpoints)
+
+        entries = [_COUNTERS.pack(self.count, self.deleted)]
+        for offset, image in pending.items():
+            entries.append(_OFFSET.pack(offset))
+            entries.append(image)
+        payload = b"".join(entries)
+        self.journal.write(_BATCH.pack(len(payload), hashutils.hash256(payload)[0:4]) + payload)
+        self.journal.flush()
+        if self.sync:
+            os.fsync(self.journal.fileno())
+
+        map_ = self.map
+        for offset, image in pending.items():
+            map_[offset:offset + _SLOT_SIZE] = image
+        self._write_header()
+
+        if self.journal.tell() >= self.journal_limit:
+            self.checkpoint()
+
+    def add(self, utxo: Utxo) -> None:
+        """
+        Add a single output. Prefer :py:meth:`apply` for many outputs.
+
+        :param utxo: The output to add.
+        """
+        self.apply(adds=(utxo,))
+
+    def spend(self, txid: bytes, vout: int) -> None:
+        """
+        Spend a single output. Prefer :py:meth:`apply` for many outputs.
+
+        :param txid: The transaction id.
+        :param vout: The output index.
+        """
+        self.apply(spends=((txid, vout),))
+
+    def get(self, txid: bytes, vout: int) -> Optional[Utxo]:
+        """
+        Look up an unspent output.
+
+        :param txid: The transaction id.
+        :param vout: The output index.
+        :return: The output or ``None`` if it is not in the store.
+        :raise: :py:exc:`ValueError` if the txid is not 32 bytes long.
+        """
+        offset, _ = self._find(_outpoint(txid, vout), txid, vout)
+        if offset < 0:
+            return None
+        _, _, amount, script_type, hash_size, hash_ = _SLOT.unpack_from(self.map, offset)
+        return Utxo(txid, vout, amount, script_type, hash_[0:hash_size])
+
+    def checkpoint(self) -> None:
+        """
+        Flush the table to disk and truncate the journal.
+        """
+        self._write_header()
+        self.map.flush()
+        self.journal.seek(0)
+        self.journal.truncate()
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def close(self) -> None:
+        """
+        Checkpoint and close the store.
+        """
+        self.checkpoint()
+        self.journal.close()
+        self._close_table()
+
+    def __contains__(self, outpoint: Outpoint) -> bool:
+        txid, vout = outpoint
+        return self._find(_outpoint(txid, vout), txid, vout)[0] >= 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "UtxoStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return "<%s %s>" % (self.__class__.__name__, self.path)
+
+
+def _output_hash(output_script: memoryview) -> Tuple[int, bytes]:
+    script_type, hash_ = script.classify_and_extract(output_script)
+    if hash_ is None:
+        return script_type, b""
+    if script_type == script.SCRIPT_P2PK:
+        # Public keys do not fit into a record, index them by their hash160 like P2PKH.
+        return script_type, hashutils.hash160(hash_)
+    return script_type, bytes(hash_)
+
+
+def read_transaction_changes(reader: BinReader, adds: List[Utxo], spends: List[Outpoint]) -> bytes:
+    """
+    Read a serialized transaction and collect the outputs it creates and spends.
+    Unspendable (``OP_RETURN``) outputs are skipped.
+
+    :param reader: The reader positioned at the start of the transaction.
+    :param adds: The list to append created outputs to.
+    :param spends: The list to append spent outpoints to.
+    :return: The transaction id.
+    :raise: :py:exc:`ValueError` if the transaction is invalid.
+    """
+    buffer = memoryview(reader.buffer)
+    start = reader.offset
+    reader.read_int32()
+    body_start = reader.offset
+    n_inputs = reader.read_compact_uint()
+    segwit = n_inputs == 0
+    if segwit:
+        # Marker is followed by a flag, the transaction id does not cover them nor the witnesses.
+        flag = reader.read_uint8()
+        if flag != 0x01:
+            raise ValueError("Unsupported segwit flag {}.".format(flag))
+        body_start = reader.offset
+        n_inputs = reader.read_compact_uint()
+
+    for _ in range(n_inputs):
+        txid = bytes(reader.read_view(32))
+        vout = reader.read_uint32()
+        reader.read_view(reader.read_compact_uint())
+        reader.read_uint32()
+        if vout != _COINBASE_VOUT or txid != _COINBASE_TXID:
+            spends.append((txid, vout))
+
+    outputs = []
+    for vout in range(reader.read_compact_uint()):
+        amount = reader.read_int64()
+        outputs.append((vout, amount, reader.read_view(reader.read_compact_uint())))
+    body_end = reader.offset
+
+    if segwit:
+        for _ in range(n_inputs):
+            for _ in range(reader.read_compact_uint()):
+                reader.read_view(reader.read_compact_uint())
+    lock_time_start = reader.offset
+    reader.read_uint32()
+
+    if segwit:
+        txid = hashutils.hash256(b"".join((
+            buffer[start:start + 4], buffer[body_start:body_end], buffer[lock_time_start:reader.offset])))
+    else:
+        txid = hashutils.hash256(buffer[start:reader.offset])
+
+    for vout, amount, output_script in outputs:
+        script_type, hash_ = _output_hash(output_script)
+        if script_type != script.SCRIPT_NULL_DATA:
+            adds.append(Utxo(txid, vout, amount, script_type, hash_))
+    return txid
+
+
+def read_block_changes(reader: BinReader) -> Tuple[List[Utxo], List[Outpoint]]:
+    """
+    Read a serialized block and collect the outputs it creates and spends, ready for
+    :py:meth:`UtxoStore.apply`.
+
+    :param reader: The reader positioned at the start of the block.
+    :return: A tuple of created outputs and spent outpoints.
+    :raise: :py:exc:`ValueError` if a transaction is invalid.
+    """
+    adds = []
+    spends = []
+    reader.read_view(80)
+    for _ in range(reader.read_compact_uint()):
+        read_transaction_changes(reader, adds, spends)
+    return adds, spends
+
+
+if __name__ == "__main__":
+    import random
+    import tempfile
+
+    N_OUTPUTS = 1000000
+    BATCH_SIZE = 10000
+
+    rng = random.Random(0)
+    utxos = [Utxo(rng.getrandbits(256).to_bytes(32, "little"), rng.randrange(4), rng.getrandbits(40),
+                  script.SCRIPT_P2WPKH, rng.getrandbits(160).to_bytes(20, "little"))
+             for _ in range(N_OUTPUTS)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        with UtxoStore(os.path.join(directory, "utxo")) as store:
+            started = time.perf_counter()
+            for i in range(0, N_OUTPUTS, BATCH_SIZE):
+                store.apply(adds=utxos[i:i + BATCH_SIZE])
+            elapsed = time.perf_counter() - started
+            print("insert: %d outputs in %.2f s, %.0f outputs/s" % (N_OUTPUTS, elapsed, N_OUTPUTS / elapsed))
+
+            rng.shuffle(utxos)
+            started = time.perf_counter()
+            for utxo in utxos:
+                assert store.get(utxo.txid, utxo.vout) is not None
+            elapsed = time.perf_counter() - started
+            print("lookup: %d outputs in %.2f s, %.0f outputs/s" % (N_OUTPUTS, elapsed, N_OUTPUTS / elapsed))
+
+            started = time.perf_counter()
+            for i in range(0, N_OUTPUTS, BATCH_SIZE):
+                store.apply(spends=[(utxo.txid, utxo.vout) for utxo in utxos[i:i + BATCH_SIZE]])
+            elapsed = time.perf_counter() - started
+            print("spend:  %d outputs in %.2f s, %.0f outputs/s" % (N_OUTPUTS, elapsed, N_OUTPUTS / elapsed))
+            print("table:  %d slots, %d bytes" % (store.capacity, len(store.map)))